@@ -10,7 +10,10 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'password',
+        'recipes_count',
+        'followers_count',
     )
+    readonly_fields = ('recipes_count', 'followers_count')
     search_fields = ('email', 'username')
     empty_value_display = '-пусто-'
 
@@ -21,7 +24,8 @@ class IngredientInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('author', 'name', 'cooking_time')
+    list_display = ('author', 'name', 'cooking_time', 'favorites_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     search_fields = ('name', 'author', 'tags')
     list_filter = ('author', 'name', 'tags')
     inlines = (IngredientInline,)
@@ -0,0 +1,76 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+
+from .reference import reference_ingredients
+
+SEPARATOR = '\n'
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов для автодополнения.
+
+    Хранит отсортированные названия в памяти воркера: совпадения
+    по началу названия ищутся бинарным поиском, вхождения в середину —
+    поиском подстроки по склеенной строке. Перестраивается вместе
+    со снимком справочника ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _build(self, snapshot):
+        rows = sorted(
+            snapshot.rows,
+            key=lambda ingredient: (ingredient.name.lower(), ingredient.id)
+        )
+        keys = [
+            ingredient.name.lower().replace(SEPARATOR, ' ')
+            for ingredient in rows
+        ]
+        offsets = []
+        position = 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + len(SEPARATOR)
+        return snapshot, keys, rows, SEPARATOR.join(keys), offsets
+
+    def _get_state(self):
+        snapshot = reference_ingredients.snapshot()
+        state = self._state
+        if state is None or state[0] is not snapshot:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] is not snapshot:
+                    state = self._state = self._build(snapshot)
+        return state
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по вхождению. """
+        if limit is None:
+            limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        query = query.strip().lower()
+        _, keys, rows, blob, offsets = self._get_state()
+        if not query or SEPARATOR in query:
+            return []
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit:
+            if not keys[end].startswith(query):
+                break
+            end += 1
+        result = rows[start:end]
+        position = blob.find(query)
+        while position != -1 and len(result) < limit:
+            index = bisect_right(offsets, position) - 1
+            if not keys[index].startswith(query):
+                result.append(rows[index])
+            if index + 1 == len(offsets):
+                break
+            position = blob.find(query, offsets[index + 1])
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+RECIPES_VERSION_KEY = 'recipes:version'
+RECIPE_VERSION_KEY = 'recipe:{}:version'
+AUTHOR_VERSION_KEY = 'author:{}:version'
+RECIPE_LIST_PARAMS = ('tags', 'author', 'page', 'limit')
+
+
+def get_version(key):
+    """Текущая версия набора данных в общем кеше. """
+    return cache.get(key)
+
+
+def bump_version(key):
+    """Увеличивает версию, сообщая всем воркерам об изменении данных. """
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def recipe_changed(recipe_id, author_id):
+    """Сбрасывает закешированные ответы с рецептом и его автором. """
+    bump_version(RECIPES_VERSION_KEY)
+    bump_version(RECIPE_VERSION_KEY.format(recipe_id))
+    bump_version(AUTHOR_VERSION_KEY.format(author_id))
+
+
+def make_key(prefix, version, *parts):
+    digest = hashlib.md5(
+        json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+    return f'{prefix}:{version}:{digest}'
+
+
+def recipe_list_key(request, **kwargs):
+    """Ключ списка рецептов или None, если запрос не кешируется.
+
+    Список, отфильтрованный по автору, зависит от версии автора,
+    остальные списки — от общей версии рецептов.
+    """
+    params = request.query_params
+    if set(params) - set(RECIPE_LIST_PARAMS):
+        return None
+    author = params.get('author', '')
+    if author:
+        version = get_version(AUTHOR_VERSION_KEY.format(author))
+    else:
+        version = get_version(RECIPES_VERSION_KEY)
+    return make_key(
+        'recipes:list',
+        version,
+        request.get_host(),
+        sorted(set(params.getlist('tags'))),
+        author,
+        params.get('page', '1'),
+        params.get('limit', ''),
+    )
+
+
+def recipe_detail_key(request, pk=None, **kwargs):
+    if request.query_params:
+        return None
+    return make_key(
+        'recipes:detail',
+        get_version(RECIPE_VERSION_KEY.format(pk)),
+        request.get_host(),
+        pk,
+    )
+
+
+def is_not_modified(request, entry):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return entry['etag'] in (
+            etag.strip() for etag in if_none_match.split(','))
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (if_modified_since is not None
+            and int(entry['last_modified']) <= if_modified_since)
+
+
+def cached_response(key_func):
+    """Кеширует ответы на анонимные GET-запросы.
+
+    Ответ хранится в кеше Django по версионному ключу и отдаётся
+    с заголовками ETag и Last-Modified; на условные запросы
+    возвращается 304.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+            key = key_func(request, **kwargs)
+            if key is None:
+                return method(view, request, *args, **kwargs)
+            entry = cache.get(key)
+            if entry is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                body = json.dumps(response.data, sort_keys=True, default=str)
+                entry = {
+                    'data': response.data,
+                    'etag': quote_etag(hashlib.md5(body.encode()).hexdigest()),
+                    'last_modified': time.time(),
+                }
+                cache.set(key, entry, settings.RECIPE_CACHE_TIMEOUT)
+            if is_not_modified(request, entry):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(entry['data'])
+            response['ETag'] = entry['etag']
+            response['Last-Modified'] = http_date(entry['last_modified'])
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
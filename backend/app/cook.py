@@ -0,0 +1,184 @@
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .cache import bump_version, get_version
+from .models import IngredientToRecipe
+
+INDEX_VERSION_KEY = 'cook:version'
+INDEX_CHANGE_KEY = 'cook:change:{}'
+CHANGE_TIMEOUT = 24 * 60 * 60
+MAX_INCREMENTAL_CHANGES = 100
+
+
+def recipe_ingredients_changed(recipe_id):
+    """Сообщает воркерам, что состав рецепта изменился. """
+    version = bump_version(INDEX_VERSION_KEY)
+    cache.set(INDEX_CHANGE_KEY.format(version), recipe_id, CHANGE_TIMEOUT)
+
+
+def invalidate_recipe_index():
+    """Версия без записи об изменении: воркеры перестроят индекс целиком. """
+    bump_version(INDEX_VERSION_KEY)
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс «ингредиент → рецепты» в памяти воркера.
+
+    Строится одним проходом по IngredientToRecipe. Изменения рецептов
+    приходят через версию в общем кеше: если пропущено немного версий,
+    перечитываются только изменённые рецепты, иначе индекс строится
+    заново. Индекс старше REFERENCE_MAX_AGE тоже строится заново:
+    с кешем в памяти процесса сбросы версий до воркеров не доходят.
+    Повторная сборка идёт в фоновом потоке, а запросы до её окончания
+    читают прежний индекс; синхронно строится только первый индекс.
+    Списки рецептов неизменяемы и заменяются целиком, поэтому поиск
+    читает индекс без блокировки.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = None
+        self._rebuilding = False
+        self.postings = {}
+        self.recipes = {}
+
+    def _load(self, recipe_ids=None):
+        links = IngredientToRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id')
+        if recipe_ids is not None:
+            links = links.filter(recipe_id__in=recipe_ids)
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in links.iterator():
+            recipes[recipe_id].add(ingredient_id)
+        return recipes
+
+    def _build(self):
+        postings = defaultdict(set)
+        recipes = self._load()
+        for recipe_id, ingredients in recipes.items():
+            for ingredient_id in ingredients:
+                postings[ingredient_id].add(recipe_id)
+        postings = {
+            ingredient_id: frozenset(recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        recipes = {
+            recipe_id: frozenset(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+        return postings, recipes
+
+    def _swap(self, version, postings, recipes):
+        # Изменения, применённые во время сборки, могли в неё не попасть:
+        # версия сборки ниже, и следующий refresh применит их повторно.
+        self.postings = postings
+        self.recipes = recipes
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def _rebuild_job(self):
+        try:
+            version = get_version(INDEX_VERSION_KEY)
+            postings, recipes = self._build()
+            with self._lock:
+                self._swap(version, postings, recipes)
+        finally:
+            self._rebuilding = False
+            connection.close()
+
+    def _start_rebuild(self):
+        """Запускает фоновую сборку, если она ещё не идёт. Под блокировкой. """
+        if not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(
+                target=self._rebuild_job,
+                name='cook-index',
+                daemon=True,
+            ).start()
+
+    def _apply(self, recipe_ids):
+        loaded = self._load(recipe_ids)
+        postings = self.postings
+        for recipe_id in recipe_ids:
+            old = self.recipes.get(recipe_id, frozenset())
+            new = frozenset(loaded.get(recipe_id, ()))
+            for ingredient_id in old - new:
+                remaining = postings[ingredient_id] - {recipe_id}
+                if remaining:
+                    postings[ingredient_id] = remaining
+                else:
+                    del postings[ingredient_id]
+            for ingredient_id in new - old:
+                postings[ingredient_id] = postings.get(
+                    ingredient_id, frozenset()) | {recipe_id}
+            if new:
+                self.recipes[recipe_id] = new
+            else:
+                self.recipes.pop(recipe_id, None)
+
+    def _changed_recipes(self, version):
+        """Рецепты, изменённые после загруженной версии, или None. """
+        # Версии ещё не было в кеше: bump_version начнёт отсчёт с единицы.
+        loaded = 0 if self._version is None else self._version
+        if not isinstance(loaded, int) or not isinstance(version, int):
+            return None
+        if not 0 < version - loaded <= MAX_INCREMENTAL_CHANGES:
+            return None
+        keys = [
+            INDEX_CHANGE_KEY.format(number)
+            for number in range(loaded + 1, version + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set(changes.values())
+
+    def _is_expired(self):
+        return time.monotonic() - self._built_at >= settings.REFERENCE_MAX_AGE
+
+    def refresh(self):
+        version = get_version(INDEX_VERSION_KEY)
+        if self._built_at is None:
+            with self._lock:
+                if self._built_at is None:
+                    self._swap(version, *self._build())
+            return
+        if version == self._version and not self._is_expired():
+            return
+        with self._lock:
+            if version != self._version:
+                changed = self._changed_recipes(version)
+                if changed is None:
+                    self._start_rebuild()
+                else:
+                    self._apply(changed)
+                    self._version = version
+            if self._is_expired():
+                self._start_rebuild()
+
+    def search(self, ingredient_ids, limit):
+        """Лучшие рецепты по доле имеющихся ингредиентов.
+
+        Возвращает кортежи (покрытие, совпало, id рецепта, всего).
+        """
+        self.refresh()
+        postings, recipes = self.postings, self.recipes
+        hits = Counter()
+        for ingredient_id in set(ingredient_ids):
+            hits.update(postings.get(ingredient_id, ()))
+        scored = []
+        for recipe_id, matched in hits.items():
+            total = len(recipes.get(recipe_id, ()))
+            if total:
+                scored.append((matched / total, matched, recipe_id, total))
+        return heapq.nlargest(limit, scored)
+
+
+recipe_index = RecipeIngredientIndex()
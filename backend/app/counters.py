@@ -0,0 +1,40 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Follow, Recipe, ShoppingCart, User
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def increment(model, field, delta=1, **lookup):
+    """Атомарно меняет счётчик выражением F() без чтения строки.
+
+    Счётчик не опускается ниже нуля: расхождения исправляет recount.
+    """
+    if delta < 0:
+        lookup[f'{field}__gte'] = -delta
+    return model.objects.filter(**lookup).update(**{field: F(field) + delta})
+
+
+def count_subquery(model, field):
+    """Подзапрос с фактическим числом строк model на объект. """
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), Value(0))
+
+
+def actual_counts():
+    """Пары (модель, счётчик, фактическое значение) для пересчёта. """
+    return (
+        (Recipe, 'favorites_count', count_subquery(Favorite, 'recipe')),
+        (Recipe, 'in_carts_count', count_subquery(ShoppingCart, 'recipe')),
+        (User, 'recipes_count', count_subquery(Recipe, 'author')),
+        (User, 'followers_count', count_subquery(Follow, 'author')),
+    )
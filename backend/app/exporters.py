@@ -0,0 +1,51 @@
+import csv
+import json
+
+SHOPPING_LIST_TITLE = 'Купить в магазине:'
+SHOPPING_LIST_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи. """
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(ingredients):
+    yield SHOPPING_LIST_TITLE
+    for ingredient in ingredients:
+        yield (f"\n{ingredient['ingredient__name']} "
+               f"({ingredient['ingredient__measurement_unit']}) - "
+               f"{ingredient['total']}")
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_HEADER)
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total'],
+        ))
+
+
+def shopping_list_json(ingredients):
+    yield '['
+    separator = ''
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['total'],
+        }, ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (shopping_list_txt, 'text/plain'),
+    'csv': (shopping_list_csv, 'text/csv'),
+    'json': (shopping_list_json, 'application/json'),
+}
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import FeedEntry, Follow, Recipe, User
+
+# Оставляет каждому выбранному пользователю FEED_MAX_ENTRIES новых записей.
+# Граница ищется по индексу (user, recipe) отдельно для каждого
+# пользователя, и удаляются только записи за ней: записи лент не
+# сортируются целиком, как было бы с ROW_NUMBER() по всем подписчикам.
+TRIM_SQL = '''
+    DELETE FROM app_feedentry WHERE id IN (
+        SELECT entry.id FROM app_feedentry entry JOIN (
+            SELECT users.user_id, (
+                SELECT oldest.recipe_id FROM app_feedentry oldest
+                WHERE oldest.user_id = users.user_id
+                ORDER BY oldest.recipe_id DESC LIMIT 1 OFFSET %s
+            ) AS cutoff
+            FROM ({}) users
+        ) limits ON entry.user_id = limits.user_id
+            AND entry.recipe_id <= limits.cutoff
+    )
+'''
+
+
+def is_celebrity(author):
+    """Ленты подписчиков таких авторов дополняются при чтении. """
+    return author.followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def trim(user_sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            TRIM_SQL.format(user_sql),
+            [settings.FEED_MAX_ENTRIES, *params],
+        )
+
+
+def fan_out(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора. """
+    author = User.objects.only('followers_count').get(pk=recipe.author_id)
+    if is_celebrity(author):
+        return
+    followers = Follow.objects.filter(
+        author=recipe.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe=recipe, author_id=author.pk)
+            for user_id in followers
+        ],
+        ignore_conflicts=True,
+    )
+    trim('SELECT user_id FROM app_follow WHERE author_id = %s', [author.pk])
+
+
+def backfill(user, author):
+    """Переносит в ленту последние рецепты автора после подписки. """
+    if is_celebrity(author):
+        return
+    recipes = Recipe.objects.filter(author=author).order_by(
+        '-id').values_list('id', flat=True)[:settings.FEED_MAX_ENTRIES]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user.pk, recipe_id=recipe_id, author_id=author.pk)
+            for recipe_id in recipes
+        ],
+        ignore_conflicts=True,
+    )
+    trim('SELECT CAST(%s AS integer) AS user_id', [user.pk])
+
+
+def remove_author(user, author):
+    """Убирает из ленты рецепты автора после отписки. """
+    FeedEntry.objects.filter(user=user, author=author).delete()
+
+
+def feed_queryset(user):
+    """Рецепты ленты: записи из таблицы и рецепты популярных авторов.
+
+    Без популярных авторов это один проход по индексу (user, recipe).
+    """
+    celebrities = list(Follow.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+    if not celebrities:
+        return Recipe.objects.filter(feed_entries__user=user)
+    return Recipe.objects.filter(
+        Q(id__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=celebrities)
+    )
@@ -1,7 +1,10 @@
 import django_filters
+from django.db.models import Exists, OuterRef
 from rest_framework.filters import SearchFilter
 
-from .models import Ingredient, Recipe, Tag
+from .models import Favorite, Ingredient, Recipe, ShoppingCart
+from .reference import reference_tags
+from .search import search_recipes
 
 
 class IngredientFilter(SearchFilter):
@@ -14,31 +17,68 @@ class IngredientFilter(SearchFilter):
         fields = ('name',)
 
 
+def tag_choices():
+    return [(tag.slug, tag.name) for tag in reference_tags.all()]
+
+
 class MyFilterSet(django_filters.rest_framework.FilterSet):
     """Фильтр для рецептов. """
 
     author = django_filters.rest_framework.NumberFilter(
         field_name='author__id')
-    tags = django_filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = django_filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags'
     )
     is_favorited = django_filters.NumberFilter(
         method='filter_is_favorited')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='filter_shopping_cart')
+    search = django_filters.CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, ингредиентам и описанию. """
+        return search_recipes(queryset, value)
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов.
+
+        Слаги переводятся в id по справочнику в памяти, а проверка идёт
+        подзапросом Exists по индексу (recipe, tag) без JOIN и DISTINCT.
+        """
+        if not value:
+            return queryset
+        slugs = set(value)
+        tag_ids = [tag.pk for tag in reference_tags.all() if tag.slug in slugs]
+        return queryset.annotate(has_tags=Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag_id__in=tag_ids)
+        )).filter(has_tags=True)
+
+    def filter_user_flag(self, queryset, flag, model, value):
+        """Оставляет рецепты, отмеченные пользователем.
+
+        Флаг проверяется подзапросом Exists по уникальному индексу
+        (user, recipe), поэтому строки не дублируются при сочетании
+        с другими фильтрами.
+        """
+        if not value:
+            return queryset
+        user = getattr(self.request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return queryset.none()
+        return queryset.annotate(**{flag: Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')))}).filter(**{flag: True})
 
     def filter_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
-        return queryset
+        return self.filter_user_flag(
+            queryset, 'is_in_shopping_cart', ShoppingCart, value)
 
     def filter_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(infavorite__user=self.request.user)
-        return queryset
+        return self.filter_user_flag(
+            queryset, 'is_favorited', Favorite, value)
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search']
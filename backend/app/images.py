@@ -0,0 +1,201 @@
+import base64
+import binascii
+import io
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import recipe_changed
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+INCOMING_DIR = 'app/incoming'
+THUMBNAILS_DIR = 'app/thumbs'
+MAX_SIDE = 1920
+THUMBNAIL_SIZES = {'small': 320, 'medium': 640}
+LIST_SIZE = 'medium'
+SHORT_SIZE = 'small'
+THUMBNAIL_FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+)
+# WebP — контейнер RIFF, после размера в байтах 8–12 идёт метка WEBP.
+WEBP_SIGNATURE = (b'RIFF', b'WEBP')
+# Image.verify() не читает данные JPEG и GIF, поэтому обрезанный файл
+# этих форматов узнаётся по отсутствию маркера конца.
+END_MARKERS = {'JPEG': b'\xff\xd9', 'GIF': b'\x3b'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    thread_name_prefix='recipe-images',
+                )
+    return _executor
+
+
+def looks_like_image(head):
+    if head[:4] == WEBP_SIGNATURE[0]:
+        return head[8:12] == WEBP_SIGNATURE[1]
+    return head.startswith(IMAGE_SIGNATURES)
+
+
+def verify(data):
+    """Проверяет структуру изображения, не декодируя пиксели.
+
+    Возвращает формат изображения или бросает ValueError.
+    """
+    if not looks_like_image(data[:16]):
+        raise ValueError('Неизвестный формат изображения')
+    try:
+        image = Image.open(io.BytesIO(data))
+        image_format, size = image.format, image.size
+        image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        raise ValueError('Повреждённое изображение') from error
+    if max(size) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+        raise ValueError('Слишком большое изображение')
+    marker = END_MARKERS.get(image_format)
+    if marker and not data.rstrip(b'\x00').endswith(marker):
+        raise ValueError('Обрезанное изображение')
+    return image_format
+
+
+def stage(data):
+    """Кладёт загрузку в очередь обработки, не декодируя её.
+
+    Файл переносится в хранилище без повторного чтения.
+    """
+    extension = os.path.splitext(data.name)[1].lower()[:8]
+    name = os.path.join(INCOMING_DIR, f'{uuid.uuid4().hex}{extension}')
+    return default_storage.save(name, data)
+
+
+def thumbnail_name(image_name, size, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return os.path.join(THUMBNAILS_DIR, f'{stem}_{size}.{extension}')
+
+
+def enqueue(recipe_id, staged_name):
+    """Отправляет изображение рецепта в обработку после коммита. """
+    if settings.IMAGE_PROCESSING_ASYNC:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_job, recipe_id, staged_name))
+    else:
+        transaction.on_commit(lambda: process(recipe_id, staged_name))
+
+
+def run_job(recipe_id, source_name):
+    close_old_connections()
+    try:
+        process(recipe_id, source_name)
+    finally:
+        close_old_connections()
+
+
+def open_source(source_name):
+    with default_storage.open(source_name, 'rb') as file:
+        # Загрузки в base64, поставленные в очередь прежними версиями.
+        if source_name.endswith('.b64'):
+            file = io.BytesIO(base64.b64decode(file.read()))
+        image = Image.open(file)
+        image.load()
+    return image
+
+
+def save_image(image, name, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format.upper(), quality=85, optimize=True)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process(recipe_id, source_name):
+    """Нормализует изображение рецепта и строит миниатюры.
+
+    Результат записывается, только если за время обработки
+    рецепту не загрузили другое изображение.
+    """
+    try:
+        image = ImageOps.exif_transpose(open_source(source_name))
+        image = image.convert('RGB')
+        image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        if source_name.startswith(INCOMING_DIR):
+            name = save_image(
+                image, f'app/{uuid.uuid4().hex}.jpg', 'jpeg')
+        else:
+            name = source_name
+        for size, side in THUMBNAIL_SIZES.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail((side, side), Image.LANCZOS)
+            for image_format, extension in THUMBNAIL_FORMATS.items():
+                save_image(
+                    thumbnail,
+                    thumbnail_name(name, size, extension),
+                    image_format,
+                )
+        status = Recipe.IMAGE_READY
+    except (OSError, ValueError, binascii.Error, Image.DecompressionBombError):
+        logger.exception('Не удалось обработать изображение %s', source_name)
+        name, status = source_name, Recipe.IMAGE_FAILED
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=source_name
+    ).update(image=name, image_status=status)
+    if source_name != name and default_storage.exists(source_name):
+        default_storage.delete(source_name)
+    if updated:
+        author_id = Recipe.objects.filter(
+            pk=recipe_id).values_list('author_id', flat=True).first()
+        recipe_changed(recipe_id, author_id)
+
+
+def absolute(url, request):
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_url(recipe, size=None, request=None):
+    """URL изображения нужного размера или заглушки, пока оно готовится. """
+    if recipe.image_status == Recipe.IMAGE_READY:
+        if size is None:
+            url = recipe.image.url
+        else:
+            url = default_storage.url(thumbnail_name(
+                recipe.image.name, size, THUMBNAIL_FORMATS['jpeg']))
+    elif recipe.image_status == Recipe.IMAGE_ORIGINAL and recipe.image:
+        url = recipe.image.url
+    else:
+        url = settings.RECIPE_IMAGE_PLACEHOLDER
+    return absolute(url, request)
+
+
+def thumbnail_urls(recipe, request=None):
+    if recipe.image_status != Recipe.IMAGE_READY:
+        return {}
+    return {
+        size: {
+            image_format: absolute(default_storage.url(thumbnail_name(
+                recipe.image.name, size, extension)), request)
+            for image_format, extension in THUMBNAIL_FORMATS.items()
+        }
+        for size in THUMBNAIL_SIZES
+    }
@@ -0,0 +1,163 @@
+import json
+import math
+import time
+import tracemalloc
+
+from app.models import Follow, Ingredient, Recipe, Tag, User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+# Сравниваемые метрики и абсолютный порог шума для каждой из них.
+METRICS = {'queries': 0, 'p95_ms': 2.0, 'peak_kb': 16.0}
+
+
+def percentile(values, fraction):
+    """Перцентиль методом ближайшего ранга. """
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет запросы к БД, задержку и память основных эндпоинтов '
+            'и сравнивает их с сохранённым базовым уровнем.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл.')
+        parser.add_argument(
+            '--compare', help='JSON-файл базового уровня для сравнения.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 и памяти относительно базового уровня.',
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows', 'id').first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if None in (user, recipe, tag, ingredient):
+            raise CommandError(
+                'Нет данных для замеров: выполните seed_synthetic')
+        if not Follow.objects.filter(user=user).exists():
+            self.stderr.write('У пользователя нет подписок')
+        endpoints = (
+            ('recipes_list', None, '/recipes/'),
+            ('recipes_list_auth', user, '/recipes/'),
+            ('recipes_list_tags', user, f'/recipes/?tags={tag.slug}'),
+            ('recipes_list_favorited', user, '/recipes/?is_favorited=1'),
+            ('recipes_list_in_cart', user,
+             '/recipes/?is_in_shopping_cart=1'),
+            ('recipes_list_author', user,
+             f'/recipes/?author={recipe.author_id}'),
+            ('recipe_detail', user, f'/recipes/{recipe.id}/'),
+            ('subscriptions', user, '/subscriptions/?recipes_limit=3'),
+            ('shopping_cart_download', user,
+             '/recipes/download_shopping_cart/'),
+            ('ingredients_search', None,
+             f'/ingredients/?name={ingredient.name[:3]}'),
+        )
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, client_user, path in endpoints:
+                try:
+                    results[name] = self.measure(
+                        client_user, path, options['iterations'],
+                        options['warmup'])
+                except Exception as error:
+                    results[name] = {'error': repr(error)}
+                    self.stderr.write(f'{name:<26} ошибка: {error!r}')
+                    continue
+                self.stdout.write(
+                    f'{name:<26} {results[name]["status"]} '
+                    f'запросов {results[name]["queries"]:>3}  '
+                    f'p50 {results[name]["p50_ms"]:>8.2f} мс  '
+                    f'p95 {results[name]["p95_ms"]:>8.2f} мс  '
+                    f'память {results[name]["peak_kb"]:>8.1f} КБ'
+                )
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'iterations': options['iterations'],
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def measure(self, user, path, iterations, warmup):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        cache.clear()
+        for _ in range(warmup):
+            consume(client.get(path))
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.get(path)
+            size = consume(response)
+            timings.append((time.perf_counter() - started) * 1000)
+        with CaptureQueriesContext(connection) as queries:
+            tracemalloc.start()
+            try:
+                consume(client.get(path))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return {
+            'status': response.status_code,
+            'bytes': size,
+            'queries': len(queries),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'p99_ms': round(percentile(timings, 0.99), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        regressions = []
+        for name, current in results.items():
+            base = baseline.get(name)
+            if base is None or 'error' in base:
+                continue
+            if 'error' in current:
+                regressions.append(f'{name}: {current["error"]}')
+                continue
+            for metric, noise in METRICS.items():
+                limit = base[metric]
+                if noise:
+                    limit = max(limit * (1 + tolerance), limit + noise)
+                if current[metric] > limit:
+                    regressions.append(
+                        f'{name}.{metric}: {base[metric]} -> '
+                        f'{current[metric]}')
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно базового уровня:\n'
+                + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базового уровня нет'))
@@ -0,0 +1,205 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from app.cache import bump_version
+from app.models import Ingredient, Tag
+from app.reference import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+TAG_FIELDS = ('name', 'color', 'slug')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_csv(path, fields):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if row:
+                yield dict(zip(fields, row))
+
+
+def iter_json(path, fields):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком. """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'{path}: ожидается JSON-массив')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(JSON_CHUNK_SIZE)
+                if not chunk:
+                    raise CommandError(f'{path}: некорректный JSON')
+                buffer += chunk
+                continue
+            yield {field: item[field] for field in fields}
+            buffer = buffer[end:]
+
+
+def iter_rows(path, fields):
+    if not os.path.exists(path):
+        raise CommandError(f'Файл {path} не найден')
+    if path.endswith('.json'):
+        return iter_json(path, fields)
+    return iter_csv(path, fields)
+
+
+def unique_ingredients(rows):
+    seen = set()
+    for row in rows:
+        key = (row['name'].strip(), row['measurement_unit'].strip())
+        if all(key) and key not in seen:
+            seen.add(key)
+            yield dict(zip(INGREDIENT_FIELDS, key))
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+class CSVStream(io.TextIOBase):
+    """Файлоподобная обёртка над генератором строк для COPY FROM STDIN. """
+
+    def __init__(self, rows, fields):
+        self._rows = iter(rows)
+        self._fields = fields
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or self._buffer.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow([row[field] for field in self._fields])
+            self.count += 1
+        data = self._buffer.getvalue()
+        if size < 0 or len(data) <= size:
+            chunk, rest = data, ''
+        else:
+            chunk, rest = data[:size], data[size:]
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(rest)
+        return chunk
+
+    readline = read
+
+
+class Command(BaseCommand):
+    help = 'Загружает справочник ингредиентов и тегов из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Файл ингредиентов: CSV (name,measurement_unit) или JSON.',
+        )
+        parser.add_argument(
+            '--tags',
+            help='Файл тегов: CSV (name,color,slug) или JSON.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY FROM STDIN на PostgreSQL.',
+        )
+
+    def handle(self, *args, **options):
+        if options['ingredients']:
+            started = time.monotonic()
+            rows = unique_ingredients(
+                iter_rows(options['ingredients'], INGREDIENT_FIELDS))
+            if connection.vendor == 'postgresql' and not options['no_copy']:
+                processed, created = self.copy_ingredients(rows)
+            else:
+                processed, created = self.insert_ingredients(
+                    rows, options['batch_size'])
+            bump_version(INGREDIENTS_VERSION_KEY)
+            self.report('Ингредиенты', processed, created, started)
+        if options['tags']:
+            started = time.monotonic()
+            processed, created = self.upsert_tags(
+                iter_rows(options['tags'], TAG_FIELDS))
+            bump_version(TAGS_VERSION_KEY)
+            self.report('Теги', processed, created, started)
+
+    def report(self, title, processed, created, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'{title}: обработано {processed}, добавлено {created} '
+            f'за {elapsed:.2f} с ({processed / elapsed:.0f} строк/с)'
+        ))
+
+    @transaction.atomic
+    def insert_ingredients(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        processed = 0
+        for batch in batched(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                [Ingredient(**row) for row in batch],
+                ignore_conflicts=True,
+            )
+            processed += len(batch)
+        return processed, Ingredient.objects.count() - before
+
+    @transaction.atomic
+    def copy_ingredients(self, rows):
+        table = Ingredient._meta.db_table
+        stream = CSVStream(rows, INGREDIENT_FIELDS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT DO NOTHING'
+            )
+            created = cursor.rowcount
+        return stream.count, created
+
+    @transaction.atomic
+    def upsert_tags(self, rows):
+        tags = {row['slug']: row for row in rows}
+        existing = Tag.objects.in_bulk(list(tags), field_name='slug')
+        changed = []
+        for slug, tag in existing.items():
+            row = tags[slug]
+            if (tag.name, tag.color) != (row['name'], row['color']):
+                tag.name, tag.color = row['name'], row['color']
+                changed.append(tag)
+        Tag.objects.bulk_update(changed, ('name', 'color'))
+        Tag.objects.bulk_create(
+            [Tag(**row) for slug, row in tags.items() if slug not in existing],
+            ignore_conflicts=True,
+        )
+        return len(tags), len(tags) - len(existing)
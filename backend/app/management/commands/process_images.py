@@ -0,0 +1,18 @@
+from app import images
+from app.models import Recipe
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Строит миниатюры для рецептов без них и дообрабатывает '
+            'изображения, оставшиеся в очереди.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(
+            image_status__in=(Recipe.IMAGE_ORIGINAL, Recipe.IMAGE_PENDING)
+        ).exclude(image='').values_list('pk', 'image')
+        for recipe_id, image in recipes.iterator():
+            images.process(recipe_id, image)
+        failed = Recipe.objects.filter(
+            image_status=Recipe.IMAGE_FAILED).count()
+        self.stdout.write(f'Готово, с ошибками: {failed}')
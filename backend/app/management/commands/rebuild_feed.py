@@ -0,0 +1,17 @@
+from app.feed import backfill
+from app.models import FeedEntry, Follow
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет ленты подписок по текущим подпискам.'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        FeedEntry.objects.all().delete()
+        follows = Follow.objects.select_related('user', 'author')
+        for follow in follows.iterator():
+            backfill(follow.user, follow.author)
+        self.stdout.write(
+            f'Записей в лентах: {FeedEntry.objects.count()}')
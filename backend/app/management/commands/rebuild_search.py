@@ -0,0 +1,24 @@
+from app.models import Recipe
+from app.search import prune_search_index, update_search_index
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from .load_catalogue import batched
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('id').values_list('id', flat=True)
+        indexed = 0
+        for batch in batched(recipes.iterator(), options['batch_size']):
+            update_search_index(batch)
+            indexed += len(batch)
+        pruned = prune_search_index()
+        self.stdout.write(
+            f'Проиндексировано рецептов: {indexed}, удалено лишних: {pruned}')
@@ -0,0 +1,18 @@
+from app.counters import actual_counts
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики рецептов и авторов.'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for model, field, actual in actual_counts():
+            drifted = model.objects.annotate(
+                actual=actual
+            ).exclude(**{field: F('actual')}).count()
+            model.objects.update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.object_name}.{field}: исправлено {drifted}')
@@ -0,0 +1,197 @@
+import io
+import random
+import time
+
+from app.cache import RECIPES_VERSION_KEY, bump_version
+from app.cook import invalidate_recipe_index
+from app.counters import actual_counts
+from app.models import (Favorite, Follow, Ingredient, IngredientToRecipe,
+                        Recipe, ShoppingCart, Tag, User)
+from app.reference import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
+from app.search import update_search_index
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from .load_catalogue import batched
+
+USERNAME_PREFIX = 'synthetic'
+IMAGE_NAME = 'app/synthetic.jpg'
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+WORDS = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Запеканка', 'Омлет', 'Паста',
+    'домашний', 'острый', 'быстрый', 'летний', 'сырный', 'овощной',
+    'с грибами', 'с курицей', 'с тыквой', 'по-деревенски',
+)
+
+
+def zipf_weights(size, exponent=1.1):
+    """Веса с длинным хвостом: немногие авторы и рецепты популярны. """
+    return [1 / (rank + 1) ** exponent for rank in range(size)]
+
+
+def sample(rng, population, weights, size):
+    """Выборка без повторов с учётом весов. """
+    size = min(size, len(population))
+    chosen = set()
+    while len(chosen) < size:
+        chosen.update(rng.choices(population, weights, k=size - len(chosen)))
+    return chosen
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетических пользователей, рецепты и связи.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-user', type=int, default=5)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Зерно генератора: одинаковые параметры дают те же данные.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if not Ingredient.objects.exists():
+            call_command('load_catalogue', stdout=self.stdout)
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredients:
+            raise CommandError('Справочник ингредиентов пуст')
+        with transaction.atomic():
+            tags = self.ensure_tags()
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                users, tags, ingredients, options['recipes_per_user'],
+                options['ingredients_per_recipe'])
+            follows = self.create_relations(
+                Follow, users, users, options['follows_per_user'],
+                'user', 'author')
+            favorites = self.create_relations(
+                Favorite, users, recipes, options['favorites_per_user'],
+                'user', 'recipe')
+            carts = self.create_relations(
+                ShoppingCart, users, recipes, options['cart_per_user'],
+                'user', 'recipe')
+            for model, field, actual in actual_counts():
+                model.objects.update(**{field: actual})
+            call_command('rebuild_feed', stdout=self.stdout)
+        for key in (RECIPES_VERSION_KEY, TAGS_VERSION_KEY,
+                    INGREDIENTS_VERSION_KEY):
+            bump_version(key)
+        invalidate_recipe_index()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей {len(users)}, рецептов {len(recipes)}, '
+            f'подписок {follows}, избранного {favorites}, '
+            f'покупок {carts} за {time.monotonic() - started:.2f} с'
+        ))
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        offset = User.objects.filter(
+            username__startswith=USERNAME_PREFIX).count()
+        password = make_password(USERNAME_PREFIX)
+        names = [
+            f'{USERNAME_PREFIX}{number}'
+            for number in range(offset, offset + count)
+        ]
+        for batch in batched(names, self.batch_size):
+            User.objects.bulk_create(
+                User(
+                    username=name,
+                    email=f'{name}@example.com',
+                    first_name=name.capitalize(),
+                    last_name='Тестов',
+                    password=password,
+                )
+                for name in batch
+            )
+        return list(User.objects.filter(
+            username__in=names).values_list('id', flat=True))
+
+    def create_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = io.BytesIO()
+            Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'JPEG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
+
+    def create_recipes(self, users, tags, ingredients, per_user,
+                       per_recipe):
+        rng = self.rng
+        image = self.create_image()
+        weights = zipf_weights(len(users))
+        authors = rng.choices(users, weights, k=len(users) * per_user)
+        first_id = (Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0) + 1
+        for batch in batched(authors, self.batch_size):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=author,
+                    name=' '.join(rng.sample(WORDS, 2)),
+                    text=' '.join(rng.choices(WORDS, k=30)),
+                    image=image,
+                    cooking_time=rng.randint(5, 180),
+                )
+                for author in batch
+            )
+        recipes = list(Recipe.objects.filter(
+            id__gte=first_id).values_list('id', flat=True))
+        recipe_tags = (
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, len(tags)))
+        )
+        for batch in batched(recipe_tags, self.batch_size):
+            Recipe.tags.through.objects.bulk_create(batch)
+        amounts = (
+            IngredientToRecipe(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=rng.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients, min(per_recipe, len(ingredients)))
+        )
+        for batch in batched(amounts, self.batch_size):
+            IngredientToRecipe.objects.bulk_create(batch)
+        for batch in batched(recipes, self.batch_size):
+            update_search_index(batch)
+        return recipes
+
+    def create_relations(self, model, users, targets, per_user, user_field,
+                         target_field):
+        weights = zipf_weights(len(targets))
+        rows = (
+            model(**{f'{user_field}_id': user, f'{target_field}_id': target})
+            for user in users
+            for target in sample(self.rng, targets, weights, per_user)
+            if target != user or model is not Follow
+        )
+        created = 0
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        return created
@@ -0,0 +1,236 @@
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = (
+    ('foodgram_request_seconds', 'Время обработки запроса.',
+     SECONDS_BUCKETS),
+    ('foodgram_db_queries', 'Число SQL-запросов на запрос.', QUERY_BUCKETS),
+    ('foodgram_db_seconds', 'Время SQL-запросов на запрос.',
+     SECONDS_BUCKETS),
+    ('foodgram_serialization_seconds', 'Время сериализации данных ответа.',
+     SECONDS_BUCKETS),
+    ('foodgram_render_seconds',
+     'Время рендеринга ответа и его обработки middleware.', SECONDS_BUCKETS),
+    ('foodgram_response_bytes', 'Размер тела ответа.', BYTES_BUCKETS),
+)
+DUPLICATES = 'foodgram_duplicate_queries_total'
+
+
+class Histogram:
+    """Накопительная гистограмма в формате Prometheus. """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Метрики эндпоинтов в памяти процесса. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {
+            name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+            for name, _, buckets in HISTOGRAMS
+        }
+        self.duplicates = Counter()
+
+    def observe(self, view, values, duplicated):
+        with self._lock:
+            for name, value in values.items():
+                if value is not None:
+                    self.histograms[name][view].observe(value)
+            if duplicated:
+                self.duplicates[view] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, help_text, buckets in HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    bounds = [str(bound) for bound in buckets] + ['+Inf']
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(
+                            f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                            f'{cumulative}')
+                    lines.append(
+                        f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(
+                        f'{name}_count{{view="{view}"}} {histogram.count}')
+            lines.append(
+                f'# HELP {DUPLICATES} Запросы с повторяющимся SQL (N+1).')
+            lines.append(f'# TYPE {DUPLICATES} counter')
+            for view, count in sorted(self.duplicates.items()):
+                lines.append(f'{DUPLICATES}{{view="{view}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: число, время и повторы SQL-запросов. """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+class MeteredStream:
+    """Тело потокового ответа, запросы которого попадают в метрики.
+
+    Потоковый ответ обращается к БД при чтении тела, уже после выхода
+    из вида, поэтому метрики записываются, когда поток исчерпан
+    или закрыт сервером.
+    """
+
+    def __init__(self, content, recorder, finish):
+        self.content = iter(content)
+        self.recorder = recorder
+        self.finish = finish
+        self.size = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            with connection.execute_wrapper(self.recorder):
+                chunk = next(self.content)
+        except StopIteration:
+            self.close()
+            raise
+        self.size += len(chunk)
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.finish(self.size)
+
+
+class SerializationMetricsMixin:
+    """Замеряет время сериализации ответа вида для MetricsMiddleware. """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if settings.METRICS_ENABLED:
+            request = self.request._request
+            represent = serializer.to_representation
+
+            def to_representation(instance):
+                start = perf_counter()
+                try:
+                    return represent(instance)
+                finally:
+                    request._metrics_serialized = getattr(
+                        request, '_metrics_serialized', 0
+                    ) + perf_counter() - start
+
+            serializer.to_representation = to_representation
+        return serializer
+
+
+def view_name(request):
+    """Имя вида и действия, например RecipeWiewSet.list. """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = match.func
+    view_class = getattr(func, 'cls', None)
+    if view_class is None:
+        return match.view_name or func.__name__
+    method = request.method.lower()
+    actions = getattr(func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class MetricsMiddleware:
+    """Собирает время, SQL-запросы и размер ответа по эндпоинтам. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        start = perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        view = view_name(request)
+        if view is None:
+            return response
+        if response.streaming:
+            response.streaming_content = MeteredStream(
+                response.streaming_content, recorder,
+                lambda size: self.record(request, view, recorder, start, size))
+        else:
+            self.record(request, view, recorder, start, len(response.content))
+        return response
+
+    def record(self, request, view, recorder, start, size):
+        finished = perf_counter()
+        rendered = getattr(request, '_metrics_rendered', None)
+        statement, repeats = max(
+            recorder.statements.items(),
+            key=lambda item: item[1],
+            default=('', 0),
+        )
+        duplicated = repeats >= settings.METRICS_DUPLICATE_QUERY_THRESHOLD
+        if duplicated:
+            logger.warning(
+                '%s: запрос выполнен %s раз: %s', view, repeats,
+                statement[:200])
+        registry.observe(view, {
+            'foodgram_request_seconds': finished - start,
+            'foodgram_db_queries': recorder.count,
+            'foodgram_db_seconds': recorder.time,
+            'foodgram_serialization_seconds': getattr(
+                request, '_metrics_serialized', None),
+            'foodgram_render_seconds': (
+                finished - rendered if rendered else None),
+            'foodgram_response_bytes': size,
+        }, duplicated)
+
+    def process_template_response(self, request, response):
+        request._metrics_rendered = perf_counter()
+        return response
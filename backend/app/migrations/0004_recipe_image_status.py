@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('original', 'Исходное изображение'), ('pending', 'Обрабатывается'), ('ready', 'Миниатюры готовы'), ('failed', 'Ошибка обработки')], default='original', max_length=16, verbose_name='Состояние изображения'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    'CREATE INDEX recipe_search_vector_gin ON app_recipe '
+    'USING gin (search_vector)',
+    """
+    UPDATE app_recipe SET search_vector =
+        setweight(to_tsvector('russian', name), 'A')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM app_ingredienttorecipe ir
+            JOIN app_ingredient i ON i.id = ir.ingredient_id
+            WHERE ir.recipe_id = app_recipe.id), '')), 'B')
+        || setweight(to_tsvector('russian', text), 'C')
+    """,
+)
+POSTGRESQL_BACKWARD = ('DROP INDEX IF EXISTS recipe_search_vector_gin',)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE app_recipe_fts '
+    'USING fts5(name, ingredients, text)',
+    """
+    INSERT INTO app_recipe_fts (rowid, name, ingredients, text)
+    SELECT r.id, r.name, coalesce((
+        SELECT group_concat(i.name, ' ')
+        FROM app_ingredienttorecipe ir
+        JOIN app_ingredient i ON i.id = ir.ingredient_id
+        WHERE ir.recipe_id = r.id), ''), r.text
+    FROM app_recipe r
+    """,
+)
+SQLITE_BACKWARD = ('DROP TABLE IF EXISTS app_recipe_fts',)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, ()):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_recipe_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run({'postgresql': POSTGRESQL_FORWARD,
+                 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRESQL_BACKWARD,
+                 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def backfill_feeds(apps, schema_editor):
+    """Заполняет ленты по подпискам, созданным до появления лент. """
+    Follow = apps.get_model('app', 'Follow')
+    Recipe = apps.get_model('app', 'Recipe')
+    FeedEntry = apps.get_model('app', 'FeedEntry')
+    users = Follow.objects.order_by().values_list(
+        'user_id', flat=True).distinct()
+    for user_id in users.iterator():
+        recipes = Recipe.objects.filter(
+            author__following__user_id=user_id,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).order_by('-id').values_list(
+            'id', 'author_id')[:settings.FEED_MAX_ENTRIES]
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+                for recipe_id, author_id in recipes
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_feed_entry'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from colorfield.fields import ColorField
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.forms import ValidationError
@@ -35,6 +36,14 @@ class User(AbstractUser):
         max_length=150,
         blank=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
 
     @property
     def is_user(self):
@@ -91,6 +100,12 @@ class Ingredient(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -98,9 +113,35 @@ class Ingredient(models.Model):
         return f'{self.name}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """ Запросы рецептов. """
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты фиксированным числом
+        запросов. """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredienttorecipe',
+                queryset=IngredientToRecipe.objects.select_related(
+                    'ingredient')),
+        )
+
+
 class Recipe(models.Model):
     """ Модель рецептов. """
 
+    IMAGE_ORIGINAL = 'original'
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = (
+        (IMAGE_ORIGINAL, 'Исходное изображение'),
+        (IMAGE_PENDING, 'Обрабатывается'),
+        (IMAGE_READY, 'Миниатюры готовы'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
+
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -120,6 +161,12 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='app/',
     )
+    image_status = models.CharField(
+        max_length=16,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_ORIGINAL,
+        verbose_name='Состояние изображения'
+    )
     text = models.TextField(
         verbose_name='Текст'
     )
@@ -135,6 +182,21 @@ class Recipe(models.Model):
             MaxValueValidator(1440, message='Не долше 24 часов'),
         ],
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В списках покупок'
+    )
+    # Заполняется в app.search, GIN-индекс создаётся миграцией на PostgreSQL.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-id', )
@@ -277,3 +339,42 @@ class ShoppingCart(models.Model):
     def __str__(self):
         return (f'Рецепт {self.recipe.name} в списке покупок',
                 f' пользователя: {self.user.get_username}')
+
+
+class FeedEntry(models.Model):
+    """ Запись ленты подписок: рецепт автора, на которого подписан user. """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_entries',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_entry_user_author'
+            )
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
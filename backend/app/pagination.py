@@ -1,8 +1,54 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from django.db.models import QuerySet
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """Постраничный вывод по ключу сортировки, без OFFSET и COUNT. """
+
+    page_size = 10
+    page_size_query_param = 'limit'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(
+            field for field in (
+                queryset.query.order_by or queryset.model._meta.ordering)
+            if isinstance(field, str)
+        )
+        return ordering or ('pk',)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
 
 
 class CustomPagination(PageNumberPagination):
-    """Класс формирования страниц. """
+    """Класс формирования страниц.
+
+    По умолчанию — номера страниц. Если в запросе к QuerySet есть
+    параметр cursor (для первой страницы — пустой), включается
+    KeysetPagination.
+    """
 
     page_size = 10
     page_size_query_param = 'limit'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (isinstance(queryset, QuerySet)
+                and KeysetPagination.cursor_query_param
+                in request.query_params):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
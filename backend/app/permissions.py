@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from rest_framework import permissions
 
 
@@ -7,3 +9,14 @@ class AuthorIsRequestUserPermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return (request.method in permissions.SAFE_METHODS
                 or obj.author == request.user)
+
+
+class MetricsPermission(permissions.BasePermission):
+    """ Метрики доступны по METRICS_TOKEN или администратору. """
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        header = request.META.get('HTTP_X_METRICS_TOKEN', '')
+        if token and constant_time_compare(header, token):
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import get_version
+from .models import Ingredient, Tag
+
+TAGS_VERSION_KEY = 'tags:version'
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+
+
+class Snapshot:
+    """Загруженная версия справочника. """
+
+    __slots__ = ('version', 'rows', 'by_id', 'loaded')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.by_id = {row.pk: row for row in rows}
+        self.loaded = time.monotonic()
+
+    def is_current(self, version):
+        return (
+            self.version == version
+            and time.monotonic() - self.loaded < settings.REFERENCE_MAX_AGE
+        )
+
+
+class ReferenceData:
+    """Редко меняющийся справочник, хранящийся в памяти воркера.
+
+    Все строки загружаются одним запросом; снимок перечитывается,
+    когда версия справочника в общем кеше отличается от загруженной
+    или снимок старше REFERENCE_MAX_AGE: кеш в памяти процесса
+    не передаёт воркерам сбросы версий из manage.py.
+    """
+
+    def __init__(self, model, version_key):
+        self.model = model
+        self.version_key = version_key
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def snapshot(self):
+        version = get_version(self.version_key)
+        snapshot = self._snapshot
+        if snapshot is None or not snapshot.is_current(version):
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or not snapshot.is_current(version):
+                    snapshot = self._snapshot = Snapshot(
+                        version, list(self.model.objects.order_by('pk')))
+        return snapshot
+
+    def all(self):
+        return self.snapshot().rows
+
+    def get(self, pk):
+        try:
+            return self.snapshot().by_id.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def in_bulk(self, pks):
+        by_id = self.snapshot().by_id
+        return {pk: by_id[pk] for pk in pks if pk in by_id}
+
+
+reference_tags = ReferenceData(Tag, TAGS_VERSION_KEY)
+reference_ingredients = ReferenceData(Ingredient, INGREDIENTS_VERSION_KEY)
@@ -0,0 +1,33 @@
+from django.db import connection, models
+
+
+def insert_ignore(model, **values):
+    """Вставляет строку одним запросом, если такой ещё нет.
+
+    Нарушение уникального ограничения не вызывает IntegrityError
+    и не прерывает транзакцию: в этом случае возвращается False.
+    """
+    opts = model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        quote(opts.get_field(name).column) for name in values)
+    placeholders = ', '.join(['%s'] * len(values))
+    params = [
+        value.pk if isinstance(value, models.Model) else value
+        for value in values.values()
+    ]
+    if connection.vendor == 'sqlite':
+        sql = (f'INSERT OR IGNORE INTO {quote(opts.db_table)} '
+               f'({columns}) VALUES ({placeholders})')
+    else:
+        sql = (f'INSERT INTO {quote(opts.db_table)} ({columns}) '
+               f'VALUES ({placeholders}) ON CONFLICT DO NOTHING')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+def delete_existing(model, **lookup):
+    """Удаляет строки одним DELETE и возвращает их число. """
+    deleted, _ = model.objects.filter(**lookup).delete()
+    return deleted
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+
+from .cache import bump_version, get_version
+from .models import Favorite, Follow, ShoppingCart
+
+RELATIONSHIPS_VERSION_KEY = 'user:{}:relationships:version'
+RELATIONSHIPS_KEY = 'user:{}:relationships:{}'
+FOLLOWING, FAVORITES, CART = range(3)
+
+
+class Relationships:
+    """Id авторов в подписках, избранных рецептов и рецептов в покупках. """
+
+    __slots__ = ('following', 'favorites', 'cart')
+
+    def __init__(self, following=(), favorites=(), cart=()):
+        self.following = frozenset(following)
+        self.favorites = frozenset(favorites)
+        self.cart = frozenset(cart)
+
+
+EMPTY = Relationships()
+
+
+def fetch(user):
+    """Все связи пользователя одним запросом UNION ALL. """
+    def tagged(model, field, kind):
+        return model.objects.filter(user=user).annotate(
+            kind=Value(kind, output_field=IntegerField())
+        ).values_list('kind', field).order_by()
+
+    rows = ([], [], [])
+    queryset = tagged(Follow, 'author_id', FOLLOWING).union(
+        tagged(Favorite, 'recipe_id', FAVORITES),
+        tagged(ShoppingCart, 'recipe_id', CART),
+        all=True,
+    )
+    for kind, pk in queryset:
+        rows[kind].append(pk)
+    return rows
+
+
+def load_relationships(user):
+    """Связи из общего кеша или из базы, если кеш устарел. """
+    if not user.is_authenticated:
+        return EMPTY
+    timeout = settings.RELATIONSHIPS_CACHE_TIMEOUT
+    if not timeout:
+        return Relationships(*fetch(user))
+    key = RELATIONSHIPS_KEY.format(
+        user.pk, get_version(RELATIONSHIPS_VERSION_KEY.format(user.pk)))
+    rows = cache.get(key)
+    if rows is None:
+        rows = fetch(user)
+        cache.set(key, rows, timeout)
+    return Relationships(*rows)
+
+
+def relationships_changed(user_id):
+    if settings.RELATIONSHIPS_CACHE_TIMEOUT:
+        bump_version(RELATIONSHIPS_VERSION_KEY.format(user_id))
+
+
+def request_relationships(request):
+    """Связи текущего пользователя, загружаемые один раз за запрос. """
+    if not hasattr(request, '_relationships'):
+        request._relationships = load_relationships(request.user)
+    return request._relationships
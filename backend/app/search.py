@@ -0,0 +1,165 @@
+import re
+import threading
+from html import escape
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, TextField
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'app_recipe_fts'
+# Базы отмечают совпадения символами из области частного использования:
+# текст экранируется целиком, и только потом они заменяются тегами.
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_STOP = '\ue001'
+HEADLINE_OPTIONS = (
+    f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}, '
+    'MaxWords=25, MinWords=10'
+)
+SNIPPET_TOKENS = 20
+WORD = re.compile(r'\w+')
+
+# Название важнее ингредиентов, ингредиенты важнее описания.
+POSTGRESQL_UPDATE = f'''
+    UPDATE app_recipe SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', name), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM app_ingredienttorecipe ir
+            JOIN app_ingredient i ON i.id = ir.ingredient_id
+            WHERE ir.recipe_id = app_recipe.id), '')), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', text), 'C')
+    WHERE id = ANY(%s)
+'''
+SQLITE_DELETE = f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({{}})'
+SQLITE_INSERT = f'''
+    INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text)
+    SELECT r.id, r.name, coalesce((
+        SELECT group_concat(i.name, ' ')
+        FROM app_ingredienttorecipe ir
+        JOIN app_ingredient i ON i.id = ir.ingredient_id
+        WHERE ir.recipe_id = r.id), ''), r.text
+    FROM app_recipe r WHERE r.id IN ({{}})
+'''
+SQLITE_PRUNE = f'''
+    DELETE FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT id FROM app_recipe)
+'''
+SQLITE_RANK = f'''(
+    SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH %s AND rowid = app_recipe.id
+)'''
+SQLITE_SNIPPET = f'''(
+    SELECT snippet(
+        {FTS_TABLE}, 2, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '…',
+        {SNIPPET_TOKENS})
+    FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = app_recipe.id
+)'''
+
+
+class Headline(Func):
+    """ts_headline: фрагмент описания с подсвеченными словами запроса. """
+
+    function = 'ts_headline'
+    template = (
+        f"%(function)s('{SEARCH_CONFIG}', %(expressions)s, "
+        f"'{HEADLINE_OPTIONS}')"
+    )
+    output_field = TextField()
+
+
+def update_search_index(recipe_ids):
+    """Пересчитывает поисковые данные рецептов после их сохранения. """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRESQL_UPDATE, [recipe_ids])
+        elif connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(recipe_ids))
+            cursor.execute(SQLITE_DELETE.format(placeholders), recipe_ids)
+            cursor.execute(SQLITE_INSERT.format(placeholders), recipe_ids)
+
+
+class SearchIndexQueue(threading.local):
+    """Рецепты, которые нужно переиндексировать после коммита.
+
+    Сколько бы строк рецепта ни изменилось в транзакции, он
+    пересчитывается один раз. Рецепты, удалённые до коммита,
+    пересчёт пропускает: их строк уже нет в app_recipe.
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self.flush = None
+
+    def is_scheduled(self):
+        # После отката транзакции её обработчики on_commit удаляются.
+        return self.flush is not None and any(
+            hook[1] is self.flush for hook in connection.run_on_commit)
+
+    def add(self, recipe_ids):
+        if self.is_scheduled():
+            self.pending.update(recipe_ids)
+            return
+        pending = set(recipe_ids)
+
+        def flush():
+            if self.flush is flush:
+                self.flush = None
+            update_search_index(pending)
+
+        self.pending, self.flush = pending, flush
+        transaction.on_commit(flush)
+
+
+search_index_queue = SearchIndexQueue()
+
+
+def remove_from_search_index(recipe_id):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(SQLITE_DELETE.format('%s'), [recipe_id])
+
+
+def prune_search_index():
+    """Удаляет из индекса SQLite строки уже удалённых рецептов. """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(SQLITE_PRUNE)
+            return cursor.rowcount
+    return 0
+
+
+def highlight(snippet):
+    """Фрагмент текста в HTML: совпадения в <b>, остальное экранировано. """
+    if snippet is None:
+        return None
+    return escape(snippet).replace(
+        HIGHLIGHT_START, '<b>').replace(HIGHLIGHT_STOP, '</b>')
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, по убыванию релевантности.
+
+    Добавляет аннотации search_rank и search_snippet.
+    """
+    words = WORD.findall(text.lower())
+    if not words:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(' '.join(words), config=SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+            search_snippet=Headline(F('text'), query),
+        )
+    elif connection.vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        queryset = queryset.annotate(
+            search_rank=RawSQL(SQLITE_RANK, [match], FloatField()),
+            search_snippet=RawSQL(SQLITE_SNIPPET, [match], TextField()),
+        ).filter(search_rank__isnull=False)
+    else:
+        return queryset.none()
+    return queryset.order_by('-search_rank', '-id')
@@ -1,10 +1,70 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from . import images
+from .cache import recipe_changed
+from .cook import recipe_ingredients_changed
+from .counters import increment
+from .feed import backfill, fan_out
 from .models import (Favorite, Follow, Ingredient, IngredientToRecipe, Recipe,
                      ShoppingCart, Tag, User)
+from .reference import reference_ingredients, reference_tags
+from .relations import insert_ignore
+from .relationships import relationships_changed
+from .search import highlight
+from .uploads import RejectedUpload
+
+
+class DeferredImageField(serializers.Field):
+    """Изображение в base64 или файлом из multipart/form-data.
+
+    При валидации base64 декодируется и проверяется структура файла,
+    декодирование пикселей и обработка выполняются фоновым воркером.
+    Файлы из формы уже проверены ImageUploadHandler.
+    """
+
+    default_error_messages = {
+        'invalid': 'Загрузите корректное изображение.',
+        'too_large': 'Изображение больше {max_size} байт.',
+    }
+
+    def get_value(self, dictionary):
+        errors = getattr(self.context.get('request'), 'upload_errors', {})
+        if self.field_name in errors:
+            return RejectedUpload(errors[self.field_name])
+        return super().get_value(dictionary)
+
+    def to_internal_value(self, data):
+        if isinstance(data, RejectedUpload):
+            raise serializers.ValidationError(data.message)
+        if isinstance(data, UploadedFile):
+            return data
+        if not isinstance(data, str):
+            self.fail('invalid')
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if len(data) * 3 // 4 > max_size:
+            self.fail('too_large', max_size=max_size)
+        if not data.isascii():
+            self.fail('invalid')
+        try:
+            content = base64.b64decode(data, validate=True)
+            image_format = images.verify(content)
+        except (binascii.Error, ValueError):
+            self.fail('invalid')
+        return ContentFile(content, name=f'image.{image_format.lower()}')
+
+    def to_representation(self, value):
+        return value.url if value else None
 
 
 class UserRegistrationSerializer(UserCreateSerializer):
@@ -41,6 +101,11 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        relationships = self.context.get('relationships')
+        if relationships is not None:
+            return obj.id in relationships.following
         request = self.context.get('request')
         if request:
             current_user = request.user
@@ -69,18 +134,24 @@ class TegSerializer(serializers.ModelSerializer):
 class ShortResipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецептов для простого короткого отображения"""
 
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_image(self, obj):
+        return images.image_url(
+            obj, images.SHORT_SIZE, self.context.get('request'))
+
 
 class RecipeFavoriteAndShopping(serializers.ModelSerializer):
     '''Recipe serializer for favorites and shopping list.'''
 
     id = serializers.IntegerField(source='recipe.id')
     name = serializers.CharField(source='recipe.name')
-    image = serializers.ImageField(source='recipe.image')
+    image = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField(source='recipe.cooking_time')
 
     class Meta:
@@ -92,6 +163,23 @@ class RecipeFavoriteAndShopping(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def get_image(self, obj):
+        return images.image_url(
+            obj.recipe, images.SHORT_SIZE, self.context.get('request'))
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления или удаления. """
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
 
 class IngredientToRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор модели соединяющей ингредиенты и рецепты"""
@@ -124,7 +212,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         many=True,
         source='ingredienttorecipe')
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -139,13 +228,39 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time',
         )
     read_only_fields = ('id', 'author', 'is_favorited',
                         'is_favorited')
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if hasattr(instance, 'search_rank'):
+            data['search_rank'] = instance.search_rank
+            data['search_snippet'] = highlight(instance.search_snippet)
+        if hasattr(instance, 'coverage'):
+            data['coverage'] = instance.coverage
+            data['missing_ingredients'] = instance.missing_ingredients
+        return data
+
+    def get_image(self, obj):
+        view = self.context.get('view')
+        size = None
+        if getattr(view, 'action', None) == 'list':
+            size = images.LIST_SIZE
+        return images.image_url(obj, size, self.context.get('request'))
+
+    def get_thumbnails(self, obj):
+        return images.thumbnail_urls(obj, self.context.get('request'))
+
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        relationships = self.context.get('relationships')
+        if relationships is not None:
+            return obj.id in relationships.cart
         request = self.context.get('request')
         if request:
             current_user = request.user
@@ -155,6 +270,11 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        relationships = self.context.get('relationships')
+        if relationships is not None:
+            return obj.id in relationships.favorites
         request = self.context.get('request')
         if request:
             current_user = request.user
@@ -164,16 +284,28 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         ).exists()
 
 
+class ReferenceTagField(serializers.PrimaryKeyRelatedField):
+    """Поле тега, проверяемое по справочнику в памяти без запросов. """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        tag = reference_tags.get(data)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор создания рецептов"""
 
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = ReferenceTagField(
         queryset=Tag.objects.all(),
         many=True)
     ingredients = IngredientToRecipeSerializer(
         many=True,
         source='ingredienttorecipe')
-    image = Base64ImageField()
+    image = DeferredImageField()
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -213,61 +345,128 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Отсутствуют ингредиенты!'
             )
-        ingredients_list = []
-        for ingredient in data:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError(
-                    'Есть одинаковые ингредиенты!'
-                )
-            ingredients_list.append(ingredient_id)
-            if int(ingredient.get('amount')) < 1:
-                raise serializers.ValidationError(
-                    'Количество ингредиента больше 0')
-
+        ids = [ingredient['ingredient']['id'] for ingredient in data]
+        known = reference_ingredients.in_bulk(ids)
+        missing = set(ids) - set(known)
+        if missing:
+            known.update(Ingredient.objects.in_bulk(missing))
+        seen = set()
+        errors = []
+        for ingredient, ingredient_id in zip(data, ids):
+            error = {}
+            if ingredient_id not in known:
+                error['id'] = [f'Ингредиента с id {ingredient_id} нет!']
+            elif ingredient_id in seen:
+                error['id'] = ['Есть одинаковые ингредиенты!']
+            if ingredient['amount'] < 1:
+                error['amount'] = ['Количество ингредиента больше 0']
+            seen.add(ingredient_id)
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
         return data
 
     @staticmethod
-    def create_ingredients(recipe, ingredients):
-        ingredient_liist = []
-        for ingredient in ingredients:
-            ingredient_liist.append(
-                IngredientToRecipe(
-                    recipe=recipe,
-                    ingredient_id=ingredient.get('id'),
-                    amount=ingredient.get('amount'),
-                )
+    def get_amounts(ingredients):
+        """Количество по id ингредиента из проверенных данных. """
+        return {
+            ingredient['ingredient']['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+
+    @staticmethod
+    def create_ingredients(recipe, amounts):
+        IngredientToRecipe.objects.bulk_create(
+            IngredientToRecipe(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
             )
-        IngredientToRecipe.objects.bulk_create(ingredient_liist)
+            for ingredient_id, amount in amounts.items()
+        )
 
+    @staticmethod
+    def update_tags(recipe, tags):
+        current = set(recipe.tags.values_list('id', flat=True))
+        submitted = {tag.pk for tag in tags}
+        if current - submitted:
+            recipe.tags.remove(*(current - submitted))
+        if submitted - current:
+            recipe.tags.add(*(submitted - current))
+
+    def update_ingredients(self, recipe, amounts):
+        """Меняет только добавленные, удалённые и изменённые связи. """
+        links = {
+            link.ingredient_id: link
+            for link in recipe.ingredienttorecipe.all()
+        }
+        removed = [
+            link.pk for ingredient_id, link in links.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, link in links.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != link.amount:
+                link.amount = amount
+                changed.append(link)
+        if removed:
+            IngredientToRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientToRecipe.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(recipe, {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in links
+        })
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request', None)
+        validated_data.pop('author', None)
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredienttorecipe')
+        validated_data['image'] = images.stage(validated_data['image'])
+        validated_data['image_status'] = Recipe.IMAGE_PENDING
         recipe = Recipe.objects.create(author=request.user, **validated_data)
+        increment(User, 'recipes_count', pk=request.user.pk)
         recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        self.create_ingredients(recipe, self.get_amounts(ingredients))
+        fan_out(recipe)
+        images.enqueue(recipe.pk, recipe.image.name)
+        transaction.on_commit(
+            lambda: recipe_changed(recipe.pk, recipe.author_id))
+        transaction.on_commit(lambda: recipe_ingredients_changed(recipe.pk))
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientToRecipe.objects.filter(recipe=instance).delete()
-        instance.tags.set(validated_data.pop('tags'))
-        ingredients = validated_data.pop('ingredienttorecipe')
-        self.create_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        ingredients = validated_data.pop('ingredienttorecipe', None)
+        if ingredients is not None:
+            self.update_ingredients(instance, self.get_amounts(ingredients))
+            transaction.on_commit(
+                lambda: recipe_ingredients_changed(instance.pk))
+        if 'image' in validated_data:
+            validated_data['image'] = images.stage(validated_data['image'])
+            validated_data['image_status'] = Recipe.IMAGE_PENDING
+            images.enqueue(instance.pk, validated_data['image'])
+        instance = super().update(instance, validated_data)
+        transaction.on_commit(
+            lambda: recipe_changed(instance.pk, instance.author_id))
+        return instance
 
     def to_representation(self, instance):
-        return RecipeReadSerializer(instance, context={
-            'request': self.context.get('request')
-        }).data
+        return RecipeReadSerializer(instance, context=self.context).data
 
 
 class FollowSerializer(CustomUserSerializer):
     """Сериализатор ингредиентов"""
 
     recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -292,6 +491,8 @@ class FollowSerializer(CustomUserSerializer):
         )
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return ShortResipeSerializer(obj.limited_recipes, many=True).data
         limit = self.context.get('request').query_params.get('recipes_limit')
         if limit:
             queryset = Recipe.objects.filter(
@@ -301,9 +502,6 @@ class FollowSerializer(CustomUserSerializer):
 
         return ShortResipeSerializer(queryset, many=True).data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
     def create(self, validated_data):
         request = self.context.get('request')
         author_id = self.context.get('request').parser_context.get(
@@ -311,5 +509,13 @@ class FollowSerializer(CustomUserSerializer):
 
         current_user = request.user
         author = get_object_or_404(User, pk=author_id)
-        Follow.objects.create(user=current_user, author=author)
+        if author == current_user:
+            raise serializers.ValidationError(
+                'Нельзя подписаться на самого себя')
+        if not insert_ignore(Follow, user=current_user, author=author):
+            raise serializers.ValidationError(
+                'Вы уже подписаны на этого пользователя')
+        increment(User, 'followers_count', pk=author.pk)
+        relationships_changed(current_user.pk)
+        backfill(current_user, author)
         return author
@@ -0,0 +1,61 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_version, recipe_changed
+from .cook import invalidate_recipe_index, recipe_ingredients_changed
+from .models import Ingredient, IngredientToRecipe, Recipe, Tag
+from .reference import INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY
+from .search import remove_from_search_index, search_index_queue
+
+SEARCH_FIELDS = {'name', 'text'}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, **kwargs):
+    invalidate_recipe_index()
+
+
+def index_recipes_with(ingredient):
+    search_index_queue.add(IngredientToRecipe.objects.filter(
+        ingredient=ingredient).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if not created:
+        index_recipes_with(instance)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    index_recipes_with(instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        search_index_queue.add([instance.pk])
+
+
+@receiver(post_save, sender=IngredientToRecipe)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    search_index_queue.add([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_changed(instance.pk, instance.author_id)
+    remove_from_search_index(instance.pk)
+    recipe_ingredients_changed(instance.pk)
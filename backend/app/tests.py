@@ -0,0 +1,257 @@
+import base64
+import io
+import tempfile
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .feed import backfill, fan_out
+from .metrics import registry
+from .models import (FeedEntry, Follow, Ingredient, IngredientToRecipe, Recipe,
+                     ShoppingCart, Tag, User)
+from .reference import ReferenceData
+from .search import FTS_TABLE
+
+
+def fts_queries(queries):
+    return sum(FTS_TABLE in query['sql'] for query in queries)
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы. """
+
+    PAGE_SIZES = (1, 10, 100)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color='#E26C2D', slug=f'tag{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        ]
+        for number in range(max(cls.PAGE_SIZES)):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {number}',
+                text='Описание',
+                image='app/recipe.jpg',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags)
+            IngredientToRecipe.objects.bulk_create(
+                IngredientToRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_list_queries(self, client, expected):
+        for page_size in self.PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                # Параметр x исключает ответ из кеша списка рецептов.
+                with self.assertNumQueries(expected):
+                    response = client.get(
+                        '/recipes/', {'limit': page_size, 'x': 1})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_anonymous(self):
+        self.assert_list_queries(APIClient(), 4)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_list_queries(client, 5)
+
+
+class ReferenceDataTest(TestCase):
+    """Снимок справочника устаревает, даже если версия не менялась. """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_expires(self):
+        reference = ReferenceData(Tag, 'test:tags:version')
+        snapshot = reference.snapshot()
+        self.assertIs(reference.snapshot(), snapshot)
+        # Как при записи из другого процесса: версия в кеше не сброшена.
+        Tag.objects.create(name='Новый', color='#E26C2D', slug='new')
+        self.assertEqual(reference.all(), [])
+        with override_settings(REFERENCE_MAX_AGE=0):
+            self.assertEqual(len(reference.all()), 1)
+
+
+class StreamingMetricsTest(TestCase):
+    """Запросы потокового ответа учитываются после чтения тела. """
+
+    VIEW = 'RecipeWiewSet.download_shopping_cart'
+
+    def histogram(self, name):
+        return registry.histograms[name][self.VIEW]
+
+    def test_shopping_cart_download(self):
+        user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='password')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='Описание',
+            image='app/recipe.jpg', cooking_time=10)
+        IngredientToRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=5)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        client = APIClient()
+        client.force_authenticate(user)
+        queries = self.histogram('foodgram_db_queries')
+        sizes = self.histogram('foodgram_response_bytes')
+        observed, sent = queries.count, sizes.sum
+        response = client.get('/recipes/download_shopping_cart/')
+        self.assertEqual(queries.count, observed)
+        body = b''.join(response.streaming_content)
+        response.close()
+        self.assertIn('Соль'.encode(), body)
+        self.assertEqual(queries.count, observed + 1)
+        self.assertGreater(queries.sum, 0)
+        self.assertEqual(sizes.sum - sent, len(body))
+
+
+class RecipeSearchTest(TransactionTestCase):
+    """Записи через ORM попадают в поиск, фрагмент экранирован.
+
+    Индекс обновляется после коммита, поэтому транзакции настоящие.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='author', email='author@example.com', password='password')
+
+    def create_recipe(self, text, ingredients):
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                author=self.user, name='Пирог', text=text,
+                image='app/recipe.jpg', cooking_time=10)
+            for ingredient in ingredients:
+                IngredientToRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=5)
+        return recipe
+
+    def test_orm_writes_are_indexed(self):
+        ingredient = Ingredient.objects.create(
+            name='Корица', measurement_unit='г')
+        recipe = self.create_recipe(
+            'Тесто <script>x</script> тыква', [ingredient])
+        client = APIClient()
+        for text in ('тыква', 'корица'):
+            with self.subTest(text=text):
+                results = client.get(
+                    '/recipes/', {'search': text}).data['results']
+                self.assertEqual([row['id'] for row in results], [recipe.pk])
+        response = client.get('/recipes/', {'search': 'тыква'})
+        snippet = response.data['results'][0]['search_snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('<b>тыква</b>', snippet)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Запросы к таблице FTS5')
+    def test_index_updated_once_per_transaction(self):
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            recipe = self.create_recipe('Описание', ingredients)
+        self.assertEqual(fts_queries(queries), 2)
+        with CaptureQueriesContext(connection) as queries:
+            recipe.delete()
+        self.assertEqual(fts_queries(queries), 1)
+
+
+@override_settings(FEED_MAX_ENTRIES=2)
+class FeedTrimTest(TestCase):
+    """В ленте остаются только FEED_MAX_ENTRIES новых рецептов. """
+
+    def test_fan_out_and_backfill_trim(self):
+        author, other, reader = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password')
+            for name in ('author', 'other', 'reader')
+        )
+        Follow.objects.create(user=reader, author=author)
+        recipes = []
+        for number in range(4):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='app/recipe.jpg', cooking_time=10)
+            fan_out(recipe)
+            recipes.append(recipe.pk)
+        entries = FeedEntry.objects.filter(user=reader)
+        self.assertCountEqual(
+            entries.values_list('recipe_id', flat=True), recipes[-2:])
+        newest = Recipe.objects.create(
+            author=other, name='Новый', text='Описание',
+            image='app/recipe.jpg', cooking_time=10)
+        backfill(reader, other)
+        self.assertCountEqual(
+            entries.values_list('recipe_id', flat=True),
+            [recipes[-1], newest.pk])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeImageTest(TestCase):
+    """Повреждённое изображение отклоняется до создания рецепта. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password')
+        cls.tag = Tag.objects.create(
+            name='Ужин', color='#8775D2', slug='dinner')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г')
+
+    def create(self, content):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post('/recipes/', {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+            'image': content,
+        }, format='json')
+
+    def encode(self, data):
+        return 'data:image/png;base64,' + base64.b64encode(data).decode()
+
+    def test_image_validation(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), '#E26C2D').save(buffer, 'PNG')
+        png = buffer.getvalue()
+        self.assertEqual(self.create(self.encode(png)).status_code, 201)
+        invalid = {
+            'non_ascii': self.encode(png) + 'ЖЖЖЖ',
+            'truncated': self.encode(png[:len(png) // 2 // 3 * 3]),
+            'wav': self.encode(b'RIFF\x24\x00\x00\x00WAVEfmt ' + bytes(32)),
+        }
+        for name, content in invalid.items():
+            with self.subTest(name):
+                response = self.create(content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.data)
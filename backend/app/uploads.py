@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.files.uploadhandler import (SkipFile,
+                                             TemporaryFileUploadHandler)
+from PIL import Image, ImageFile
+
+HEADER_MAX_SIZE = 64 * 1024
+
+
+class RejectedUpload:
+    """Файл, отклонённый обработчиком загрузки, с причиной отказа. """
+
+    def __init__(self, message):
+        self.message = message
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемое изображение во временный файл по частям.
+
+    Размер файла проверяется на каждом фрагменте, размеры изображения —
+    как только из первых байтов удаётся прочитать заголовок. Отклонённый
+    файл пропускается, а причина сохраняется в request.upload_errors.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.parser = ImageFile.Parser()
+        self.header_checked = False
+        self.received = 0
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = {}
+
+    def reject(self, message):
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+    def check_header(self, raw_data):
+        try:
+            self.parser.feed(raw_data)
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            self.reject('Файл не является изображением.')
+        image = self.parser.image
+        if image is None:
+            if self.received > HEADER_MAX_SIZE:
+                self.reject('Файл не является изображением.')
+            return
+        max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+        if max(image.size) > max_dimension:
+            self.reject(
+                f'Изображение больше {max_dimension} пикселей по стороне.')
+        self.header_checked = True
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.reject(
+                f'Изображение больше {settings.RECIPE_IMAGE_MAX_SIZE} байт.')
+        if not self.header_checked:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.header_checked:
+            self.file.close()
+            self.request.upload_errors[self.field_name] = (
+                'Файл не является изображением.')
+            return None
+        return super().file_complete(file_size)
@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework import routers
 
 from .views import (CustomUserViewSet, FollowListMixin, FollowMixin,
-                    IngredientViewSet, RecipeWiewSet, TagViewSet, index)
+                    IngredientViewSet, RecipeWiewSet, TagViewSet, index,
+                    metrics)
 
 router_v1 = routers.DefaultRouter()
 router_v1.register('tags', TagViewSet)
@@ -29,6 +30,7 @@ router_v1.register('', CustomUserViewSet)
 
 urlpatterns = [
     path('index', index),
+    path('_metrics', metrics),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include(router_v1.urls)),
 ]
@@ -1,47 +1,149 @@
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Subquery, Sum, Value)
+from django.http import Http404
+from django.http.response import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.functional import SimpleLazyObject
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import (filters, mixins, permissions, serializers, status,
                             viewsets)
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 
+from .autocomplete import ingredient_index
+from .cache import cached_response, recipe_detail_key, recipe_list_key
+from .cook import recipe_index
+from .counters import RECIPE_COUNTERS, increment
+from .exporters import SHOPPING_LIST_FORMATS
+from .feed import feed_queryset, remove_author
 from .filters import IngredientFilter, MyFilterSet
+from .metrics import SerializationMetricsMixin, registry
 from .models import (Favorite, Follow, Ingredient, IngredientToRecipe, Recipe,
                      ShoppingCart, Tag, User)
-from .pagination import CustomPagination
-from .permissions import AuthorIsRequestUserPermission
+from .pagination import CustomPagination, KeysetPagination
+from .permissions import AuthorIsRequestUserPermission, MetricsPermission
+from .reference import reference_ingredients, reference_tags
+from .relations import delete_existing, insert_ignore
+from .relationships import relationships_changed, request_relationships
 from .serializers import (FollowSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeFavoriteAndShopping,
-                          RecipeReadSerializer, TegSerializer)
+                          RecipeBatchSerializer, RecipeCreateSerializer,
+                          RecipeFavoriteAndShopping, RecipeReadSerializer,
+                          TegSerializer)
+from .uploads import ImageUploadHandler
+
+USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name')
 
 
 def index(request):
     return HttpResponse('index')
 
 
-class CustomUserViewSet(UserViewSet):
-    """Переопределение сериализатора. """
+@api_view(['GET'])
+@permission_classes([MetricsPermission])
+def metrics(request):
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4')
 
-    pagination_class = CustomPagination
 
-    def get_queryset(self):
-        return User.objects.all()
+def get_reference_object(reference, kwargs):
+    obj = reference.get(kwargs['pk'])
+    if obj is None:
+        raise Http404
+    return obj
+
 
+class RelationshipsMixin:
+    """Передаёт сериализаторам связи текущего пользователя.
 
-class FollowListMixin(mixins.ListModelMixin, viewsets.GenericViewSet):
+    Флаги подписки, избранного и списка покупок проверяются по
+    множествам id, загружаемым при первом обращении за запрос.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        request = self.request
+        context['relationships'] = SimpleLazyObject(
+            lambda: request_relationships(request))
+        return context
+
+
+class CustomUserViewSet(
+    SerializationMetricsMixin, RelationshipsMixin, UserViewSet
+):
+    """Переопределение сериализатора.
+
+    Список и профиль читают только выводимые поля и флаг подписки
+    из подзапроса. Постраничный вывод по ключу — с параметром cursor,
+    пакетная выборка — с параметром ids=1,2,3.
+    """
+
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        if user.is_authenticated:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')))
+        else:
+            is_subscribed = Value(False, output_field=BooleanField())
+        return queryset.only(*USER_FIELDS).annotate(
+            is_subscribed=is_subscribed)
+
+    def list(self, request, *args, **kwargs):
+        ids = request.query_params.get('ids')
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            user_ids = {int(pk) for pk in ids.split(',') if pk.strip()}
+        except ValueError:
+            raise serializers.ValidationError(
+                {'ids': 'Ожидается список id через запятую'})
+        if len(user_ids) > settings.USER_LOOKUP_MAX_IDS:
+            raise serializers.ValidationError({'ids': (
+                f'Не более {settings.USER_LOOKUP_MAX_IDS} id за запрос')})
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            pk__in=user_ids)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+
+class FollowListMixin(
+    SerializationMetricsMixin,
+    RelationshipsMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet
+):
     """Отображениее списка подписок. """
 
     serializer_class = FollowSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        recipes = Recipe.objects.all()
+        limit = self.request.query_params.get('recipes_limit', '')
+        if limit.isdigit():
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-id').values('id')[:int(limit)]
+            ))
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
 
 
 class FollowMixin(
+    SerializationMetricsMixin,
+    RelationshipsMixin,
     mixins.CreateModelMixin,
     mixins.DestroyModelMixin,
     viewsets.GenericViewSet
@@ -52,21 +154,20 @@ class FollowMixin(
     queryset = User.objects.all()
 
     def delete(self, request, *args, **kwargs):
-        user_id = self.kwargs['user_id']
-        author = get_object_or_404(User, pk=user_id)
-
-        instance = Follow.objects.filter(
-            user=request.user, author=author).exists()
-
-        if not instance:
+        author = get_object_or_404(User, pk=self.kwargs['user_id'])
+        if not delete_existing(Follow, user=request.user, author=author):
             raise serializers.ValidationError(
                 'Вы не подписаны на этого пользователя'
             )
-        self.perform_destroy(instance)
+        increment(User, 'followers_count', -1, pk=author.pk)
+        relationships_changed(request.user.pk)
+        remove_author(request.user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    SerializationMetricsMixin, viewsets.ReadOnlyModelViewSet
+):
     """Отображение одного ингредиента или списка"""
 
     queryset = Ingredient.objects.all()
@@ -75,15 +176,37 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (IngredientFilter, )
     search_fields = ('^name', )
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientFilter.search_param)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_serializer(
+            ingredient_index.search(name), many=True)
+        return Response(serializer.data)
+
+    def get_queryset(self):
+        return reference_ingredients.all()
+
+    def get_object(self):
+        return get_reference_object(reference_ingredients, self.kwargs)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(SerializationMetricsMixin, viewsets.ReadOnlyModelViewSet):
     """Отображение одного тега или списка"""
 
     queryset = Tag.objects.all()
     serializer_class = TegSerializer
 
+    def get_queryset(self):
+        return reference_tags.all()
+
+    def get_object(self):
+        return get_reference_object(reference_tags, self.kwargs)
+
 
-class RecipeWiewSet(viewsets.ModelViewSet):
+class RecipeWiewSet(
+    SerializationMetricsMixin, RelationshipsMixin, viewsets.ModelViewSet
+):
     """Отображение и создание рецептов"""
 
     permission_classes = (AuthorIsRequestUserPermission, )
@@ -91,6 +214,21 @@ class RecipeWiewSet(viewsets.ModelViewSet):
     filter_class = MyFilterSet
     pagination_class = CustomPagination
 
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Recipe.objects.with_related()
+
+    @cached_response(recipe_list_key)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response(recipe_detail_key)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeReadSerializer
@@ -99,6 +237,52 @@ class RecipeWiewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        instance.delete()
+        increment(User, 'recipes_count', -1, pk=instance.author_id)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        """Новые рецепты авторов из подписок, от свежих к старым. """
+        queryset = feed_queryset(
+            request.user).with_related().order_by('-id')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'])
+    def cook(self, request):
+        """Рецепты, для которых есть больше всего ингредиентов. """
+        values = ','.join(request.query_params.getlist('ingredients'))
+        try:
+            ingredient_ids = {
+                int(value) for value in values.split(',') if value.strip()}
+            limit = int(request.query_params.get(
+                'limit', settings.COOK_RESULTS_LIMIT))
+        except ValueError:
+            raise serializers.ValidationError(
+                'ingredients и limit должны быть целыми числами')
+        if not ingredient_ids:
+            raise serializers.ValidationError(
+                {'ingredients': 'Укажите id имеющихся ингредиентов'})
+        limit = min(max(limit, 1), settings.COOK_RESULTS_MAX_LIMIT)
+        matches = recipe_index.search(ingredient_ids, limit)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, _, recipe_id, _ in matches])
+        result = []
+        for coverage, matched, recipe_id, total in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.coverage = round(coverage, 4)
+                recipe.missing_ingredients = total - matched
+                result.append(recipe)
+        return Response(self.get_serializer(result, many=True).data)
+
     @action(
         detail=True,
         methods=["POST", "DELETE"],
@@ -119,42 +303,109 @@ class RecipeWiewSet(viewsets.ModelViewSet):
             return self.save(ShoppingCart, request.user, pk)
         return self.remove(ShoppingCart, request.user, pk)
 
-    @staticmethod
-    def list_ingredients(ingredients):
-        shopping_list = 'Купить в магазине:'
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['amount']}")
-        file = 'shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="{file}.txt"'
-        return response
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-batch',
+    )
+    def favorite_batch(self, request):
+        return self.batch(Favorite, request)
 
-    @action(detail=False, methods=['GET'])
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[permissions.IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch(ShoppingCart, request)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[permissions.IsAuthenticated],
+    )
     def download_shopping_cart(self, request):
-        """ Скачивает список покупок. """
+        """ Скачивает список покупок в формате txt, csv или json. """
+        file_type = request.query_params.get('file_type', 'txt')
+        if file_type not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: '
+                 + ', '.join(SHOPPING_LIST_FORMATS)},
+                status=status.HTTP_400_BAD_REQUEST)
         ingredients = IngredientToRecipe.objects.filter(
             recipe__shopping_list__user=request.user
-        ).order_by('ingredient__name').values(
+        ).values(
             'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(total=Sum('amount'))
-        return self.list_ingredients(ingredients)
+        ).annotate(total=Sum('amount')).order_by('ingredient__name')
+        export, content_type = SHOPPING_LIST_FORMATS[file_type]
+        response = StreamingHttpResponse(
+            export(ingredients.iterator()),
+            content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"')
+        return response
 
     def save(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        recipe = get_object_or_404(Recipe, id=pk)
+        if not insert_ignore(model, user=user, recipe=recipe):
             return Response({'errors': 'The recipe has been added!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        recipe = get_object_or_404(Recipe, id=pk)
-        obj = model.objects.create(user=user, recipe=recipe)
-        serializer = RecipeFavoriteAndShopping(obj)
+        increment(Recipe, RECIPE_COUNTERS[model], pk=recipe.pk)
+        relationships_changed(user.pk)
+        serializer = RecipeFavoriteAndShopping(model(user=user, recipe=recipe))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
+    def batch(self, model, request):
+        """Добавляет или удаляет несколько рецептов за один запрос.
+
+        Возвращает статус по каждому id: added, exists, not_found
+        или removed, absent.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        user = request.user
+        transaction.on_commit(lambda: relationships_changed(user.pk))
+        present = set(model.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        if request.method == 'DELETE':
+            model.objects.filter(user=user, recipe_id__in=present).delete()
+            increment(Recipe, RECIPE_COUNTERS[model], -1, pk__in=present)
+            statuses = {True: 'removed', False: 'absent'}
+            results = [
+                {'id': pk, 'status': statuses[pk in present]}
+                for pk in recipe_ids
+            ]
+            return Response({'results': results})
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', flat=True))
+        added = found - present
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=pk) for pk in added],
+            ignore_conflicts=True,
+        )
+        increment(Recipe, RECIPE_COUNTERS[model], pk__in=added)
+        results = []
+        for pk in recipe_ids:
+            if pk in present:
+                result = 'exists'
+            elif pk in found:
+                result = 'added'
+            else:
+                result = 'not_found'
+            results.append({'id': pk, 'status': result})
+        return Response({'results': results})
+
     def remove(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+        if delete_existing(model, user=user, recipe_id=pk):
+            increment(Recipe, RECIPE_COUNTERS[model], -1, pk=pk)
+            relationships_changed(user.pk)
             return Response({'message':
                              'The recipe has been successfully deleted.'},
                             status=status.HTTP_204_NO_CONTENT)
@@ -32,6 +32,7 @@ AUTH_USER_MODEL = 'app.User'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -40,6 +41,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+METRICS_DUPLICATE_QUERY_THRESHOLD = int(
+    os.getenv('METRICS_DUPLICATE_QUERY_THRESHOLD', default=10))
+
 ROOT_URLCONF = 'backend.urls'
 
 MIGRATION_MODULES = {'sites': 'contrib.sites.migrations'}
@@ -74,6 +80,27 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=300))
+# С кешем в памяти процесса воркеры не видят сбросы версий друг друга,
+# поэтому связи пользователя тогда загружаются заново в каждом запросе.
+RELATIONSHIPS_CACHE_TIMEOUT = int(os.getenv(
+    'RELATIONSHIPS_CACHE_TIMEOUT',
+    default=0 if 'locmem' in CACHES['default']['BACKEND'] else 600))
+# Справочники и индекс «что приготовить» в памяти воркера перечитываются
+# не реже, чем раз в столько секунд, даже если сброс версии не дошёл.
+REFERENCE_MAX_AGE = int(os.getenv(
+    'REFERENCE_MAX_AGE',
+    default=60 if 'locmem' in CACHES['default']['BACKEND'] else 3600))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -106,6 +133,15 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+IMAGE_PROCESSING_ASYNC = os.getenv(
+    'IMAGE_PROCESSING_ASYNC', default='True') == 'True'
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_DIMENSION = int(
+    os.getenv('RECIPE_IMAGE_MAX_DIMENSION', default=8000))
+RECIPE_IMAGE_PLACEHOLDER = STATIC_URL + 'app/placeholder.svg'
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -136,6 +172,16 @@ DJOSER = {
         'user_list': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
     }
 }
+INGREDIENT_AUTOCOMPLETE_LIMIT = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_LIMIT', default=20))
+COOK_RESULTS_LIMIT = int(os.getenv('COOK_RESULTS_LIMIT', default=10))
+COOK_RESULTS_MAX_LIMIT = 50
+RECIPE_BATCH_MAX_SIZE = 100
+USER_LOOKUP_MAX_IDS = 100
+FEED_MAX_ENTRIES = int(os.getenv('FEED_MAX_ENTRIES', default=500))
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=10000))
+
 ADMIN_EMAIL = 'no-reply@yamdb.com'
 
 SIMPLE_JWT = {